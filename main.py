@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
+import functools
+import itertools
 import json
+import logging
 import os
+import random
 import re
+import shutil
+import sys
 import time
-import traceback
 import hashlib
-import uuid
+import hmac
+import queue
+import threading
 import warnings
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Tuple
-from urllib.parse import unquote, urlencode
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
 from zoneinfo import ZoneInfo
 
 # Hide non-critical runtime warnings in this long-running bot process.
@@ -36,6 +45,39 @@ import jwt
 import requests
 from dotenv import load_dotenv
 from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is used when absent
+    orjson = None
+
+try:
+    from ciso8601 import parse_datetime as _ciso8601_parse_datetime
+except ImportError:  # optional speedup; datetime.fromisoformat is used when absent
+    _ciso8601_parse_datetime = None
+
+_FLOAT_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
+_SYMBOL_RE = re.compile(r"\(([^)]+)\)")
+_MMDD_RE = re.compile(r"(\d{1,2})\s*/\s*(\d{1,2})")
+_SAFE_RE = re.compile(r"[^0-9A-Za-z._-]+")
+_ISO_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+_SELL_COMPLETE_RE = re.compile(r"^\s*([A-Za-z0-9_-]+)\s+매도\s*완료\s*$")
+_COLUMN_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_MERITZ_FILL_HEADER = "[메리츠증권] 해외주식 주문체결 안내"
+
+TELEGRAM_ALLOWED_UPDATES = ["message", "edited_message", "channel_post", "edited_channel_post"]
+# getUpdates returns at most 100 updates; a batch this large means more are waiting on Telegram's side.
+TELEGRAM_BURST_BATCH = 90
+# Some proxies drop idle connections held longer than ~50s.
+TELEGRAM_MAX_POLL_TIMEOUT = 50
+TELEGRAM_MAX_MESSAGE_LEN = 4096
+RECENT_UPDATE_IDS_LIMIT = 1000
+UPBIT_PAGE_LIMIT = 100
+UPBIT_FETCH_WORKERS = 4
+# Per-process counter makes nonces unique even when parallel page requests share a time_ns tick.
+_UPBIT_NONCE_COUNTER = itertools.count()
 
 
 @dataclass
@@ -74,6 +116,15 @@ class UpbitFill:
 
 
 @dataclass
+class BotState:
+    last_update_id: int = 0
+    default_chat_id: Optional[int] = None
+    processed_upbit_fill_ids: List[str] = field(default_factory=list)
+    # Handled update_ids, oldest first. Dedups webhook redeliveries without assuming ids arrive in order.
+    recent_update_ids: List[int] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
 class AppConfig:
     tz_name: str
     token: str
@@ -89,10 +140,25 @@ class AppConfig:
     upbit_market_sheet_map: Dict[str, str]
     upbit_base_url: str
     upbit_orders_path: str
+    upbit_max_pages: int
     upbit_command_prefix: str
     backup_dir: str
     spreadsheet_id_map: Dict[str, str]
     result_spreadsheet_id: str
+    receive_mode: str
+    webhook_url: str
+    webhook_path: str
+    webhook_listen_host: str
+    webhook_listen_port: int
+    webhook_secret_token: str
+
+
+@dataclass
+class WebhookDelivery:
+    # One webhook POST; the request thread waits on `done` and answers 200 only if `ok`.
+    updates: List[Dict]
+    done: threading.Event = field(default_factory=threading.Event)
+    ok: bool = False
 
 
 @dataclass
@@ -101,40 +167,117 @@ class UpdateContext:
     text: str
     chat_id: Optional[int]
     gc: gspread.Client
-    state: Dict
+    state: BotState
     cfg: AppConfig
     backup_cache: set
+    # chat_id -> reply texts, sent together once the update batch is done
+    replies: Dict[int, List[str]]
 
 
 StrategyHandler = Callable[[UpdateContext], bool]
 
+# Shared keep-alive pool for Telegram/Upbit calls so polling does not redo the TLS handshake each cycle.
+# Each host keeps several warm connections, so webhook request threads, the update worker and the parallel
+# Upbit page fetches never wait on each other for a socket.
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+# Telegram only: connect failures and transient gateway errors are retried for idempotent calls
+# (getUpdates); urllib3 never retries POST by default, so sendMessage cannot double-send. Read timeouts
+# are not retried (read=0): a stalled long-poll surfaces to the poller and its backoff right away.
+# Upbit is excluded because a retry would replay the same signed nonce.
+_HTTP.mount(
+    "https://api.telegram.org/",
+    HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, connect=3, read=0, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ),
+)
+HTTP_CONNECT_TIMEOUT = 5
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Drive export sessions per credentials object; the bot has one gspread client, so this holds one entry.
+_AUTHED_SESSIONS: Dict[object, AuthorizedSession] = {}
+
+
+@functools.lru_cache(maxsize=8)
+def _tz(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def json_loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj) -> bytes:
+    # Compact UTF-8; Korean reply text stays 3 bytes/char instead of 6-byte \uXXXX escapes.
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_dumps_pretty(obj) -> bytes:
+    # UTF-8, non-ASCII kept as-is, 2-space indent (same layout as json.dumps(ensure_ascii=False, indent=2)).
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+logger = logging.getLogger("trade_bot")
+
+
+def setup_logging() -> None:
+    # Same "[YYYY-MM-DD HH:MM:SS] msg" lines as before on stdout (run_bot.sh appends it to bot.log);
+    # the handler flushes per record, and tracebacks are only formatted when a record carries exc_info.
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout,
+    )
+
 
 def log(msg: str) -> None:
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{ts}] {msg}")
+    logger.info(msg)
 
 
 def backup_spreadsheet_to_local(sh: gspread.Spreadsheet, backup_dir: str, context: str, bucket: str) -> Path:
-    safe_bucket = re.sub(r"[^0-9A-Za-z._-]+", "_", bucket).strip("_") or "misc"
+    safe_bucket = _SAFE_RE.sub("_", bucket).strip("_") or "misc"
     target_dir = Path(backup_dir) / safe_bucket
     target_dir.mkdir(parents=True, exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_title = re.sub(r"[^0-9A-Za-z._-]+", "_", sh.title).strip("_") or "spreadsheet"
-    safe_context = re.sub(r"[^0-9A-Za-z._-]+", "_", context).strip("_") or "run"
+    safe_title = _SAFE_RE.sub("_", sh.title).strip("_") or "spreadsheet"
+    safe_context = _SAFE_RE.sub("_", context).strip("_") or "run"
     out_path = target_dir / f"{ts}_{safe_title}_{sh.id}_{safe_context}.xlsx"
 
     creds = sh.client.auth
     if not creds.valid:
         creds.refresh(Request())
-    authed = AuthorizedSession(creds)
+    authed = _AUTHED_SESSIONS.get(creds)
+    if authed is None:
+        authed = AuthorizedSession(creds)
+        _AUTHED_SESSIONS[creds] = authed
     export_url = f"https://www.googleapis.com/drive/v3/files/{sh.id}/export"
     resp = authed.get(
         export_url,
         params={"mimeType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
         timeout=60,
+        stream=True,
     )
-    resp.raise_for_status()
-    out_path.write_bytes(resp.content)
+    with resp:
+        resp.raise_for_status()
+        # Stream straight to disk instead of holding the whole export in memory. Written under a .part name
+        # and renamed on success, so a dropped connection never leaves a truncated file that looks valid.
+        resp.raw.decode_content = True
+        part_path = out_path.with_suffix(".xlsx.part")
+        try:
+            with open(part_path, "wb") as f:
+                shutil.copyfileobj(resp.raw, f, length=65536)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        os.replace(part_path, out_path)
     return out_path
 
 
@@ -145,9 +288,12 @@ def ensure_spreadsheet_backup_once(
     backup_context: str,
     backup_bucket: str,
 ) -> None:
-    key = f"{sh.id}:{backup_context}:{backup_bucket}"
+    # Keyed by sheet only (not context) so several updates in one batch share the first snapshot.
+    key = f"{sh.id}:{backup_bucket}"
     if key in backup_cache:
         return
+    # Synchronous on purpose: the export must complete before the caller writes, or the snapshot could
+    # already contain the change it is meant to protect against. The disk side is streamed, no fsync.
     p = backup_spreadsheet_to_local(sh, backup_dir, backup_context, backup_bucket)
     backup_cache.add(key)
     log(f"spreadsheet_backup_done path={p}")
@@ -156,24 +302,23 @@ def ensure_spreadsheet_backup_once(
 def parse_kv_message(text: str) -> Dict[str, str]:
     out: Dict[str, str] = {}
     for line in text.splitlines():
-        line = line.strip()
-        if not line or ":" not in line:
+        colon = line.find(":")
+        if colon < 0:
             continue
-        k, v = line.split(":", 1)
-        out[k.strip()] = v.strip()
+        k = line[:colon].strip()
+        if k:
+            out[k] = line[colon + 1 :].strip()
     return out
 
 
 def parse_float(text: str) -> float:
-    m = re.search(r"[-+]?\d+(?:\.\d+)?", text.replace(",", ""))
+    m = _FLOAT_RE.search(text.replace(",", ""))
     if not m:
         raise ValueError(f"number not found: {text}")
     return float(m.group(0))
 
 
-def get_numeric_cell_value(ws: gspread.Worksheet, a1: str) -> float:
-    # Prefer computed numeric value, not formula text.
-    raw = ws.acell(a1, value_render_option="UNFORMATTED_VALUE").value
+def parse_numeric_cell(a1: str, raw) -> float:
     if isinstance(raw, (int, float)):
         return float(raw)
     if isinstance(raw, str):
@@ -184,13 +329,45 @@ def get_numeric_cell_value(ws: gspread.Worksheet, a1: str) -> float:
     raise ValueError(f"{a1} 숫자 값을 읽을 수 없습니다: {raw!r}")
 
 
-def get_numeric_cell_value_or_none(ws: gspread.Worksheet, a1: str) -> Optional[float]:
+def parse_numeric_cell_or_none(a1: str, raw) -> Optional[float]:
     try:
-        return get_numeric_cell_value(ws, a1)
+        return parse_numeric_cell(a1, raw)
     except Exception:
         return None
 
 
+def get_numeric_cell_value(ws: gspread.Worksheet, a1: str) -> float:
+    # Prefer computed numeric value, not formula text.
+    raw = ws.acell(a1, value_render_option="UNFORMATTED_VALUE").value
+    return parse_numeric_cell(a1, raw)
+
+
+def get_cell_values(
+    ws: gspread.Worksheet,
+    ranges: List[str],
+    value_render_option: Optional[str] = "UNFORMATTED_VALUE",
+) -> List:
+    # Single values.batchGet round-trip; returns the top-left value of each range (None when empty).
+    out = []
+    for value_range in ws.batch_get(ranges, value_render_option=value_render_option):
+        out.append(value_range[0][0] if value_range and value_range[0] else None)
+    return out
+
+
+def update_row_cells(ws: gspread.Worksheet, row: int, cells: List[Tuple[int, object]]) -> None:
+    # One round-trip for all (col, value) cells of one row: a single rectangular range when the
+    # columns are contiguous (e.g. LOC평단/수량/LOC고가/수량 = D:G), otherwise values.batchUpdate.
+    cells = sorted(cells, key=lambda cell: cell[0])
+    first_col, last_col = cells[0][0], cells[-1][0]
+    if last_col - first_col + 1 == len(cells) == len({col for col, _ in cells}):
+        ws.update(
+            range_name=f"{col_to_a1(first_col)}{row}:{col_to_a1(last_col)}{row}",
+            values=[[value for _, value in cells]],
+        )
+        return
+    ws.batch_update([{"range": f"{col_to_a1(col)}{row}", "values": [[value]]} for col, value in cells])
+
+
 def format_two_decimals(v: float) -> str:
     return f"{v:.2f}"
 
@@ -220,24 +397,24 @@ def format_money(v: float, ccy: str) -> str:
 
 
 def parse_symbol(stock_name: str) -> str:
-    m = re.search(r"\(([^)]+)\)", stock_name)
+    m = _SYMBOL_RE.search(stock_name)
     if not m:
         raise ValueError(f"symbol not found in 종목명: {stock_name}")
     return m.group(1).strip().upper()
 
 
 def parse_fill_date(mmdd: str, tz_name: str) -> Tuple[int, int, int]:
-    m = re.search(r"(\d{1,2})\s*/\s*(\d{1,2})", mmdd)
+    m = _MMDD_RE.search(mmdd)
     if not m:
         raise ValueError(f"invalid 체결일자: {mmdd}")
     month = int(m.group(1))
     day = int(m.group(2))
-    year = datetime.now(ZoneInfo(tz_name)).year
+    year = datetime.now(_tz(tz_name)).year
     return year, month, day
 
 
 def parse_fill_message(text: str, tz_name: str) -> Optional[FillMessage]:
-    if "[메리츠증권] 해외주식 주문체결 안내" not in text:
+    if _MERITZ_FILL_HEADER not in text:
         return None
 
     kv = parse_kv_message(text)
@@ -269,12 +446,11 @@ def parse_fill_message(text: str, tz_name: str) -> Optional[FillMessage]:
 def parse_spreadsheet_id_map(raw: str) -> Dict[str, str]:
     out: Dict[str, str] = {}
     for item in raw.split(","):
-        pair = item.strip()
-        if not pair or ":" not in pair:
+        colon = item.find(":")
+        if colon < 0:
             continue
-        symbol, sheet_id = pair.split(":", 1)
-        symbol = symbol.strip().upper()
-        sheet_id = sheet_id.strip()
+        symbol = item[:colon].strip().upper()
+        sheet_id = item[colon + 1 :].strip()
         if symbol and sheet_id:
             out[symbol] = sheet_id
     return out
@@ -284,12 +460,11 @@ def parse_upbit_market_sheet_map(raw: str) -> Dict[str, str]:
     # format: KRW-BTC:BTC,KRW-ETH:ETH
     out: Dict[str, str] = {}
     for item in raw.split(","):
-        pair = item.strip()
-        if not pair or ":" not in pair:
+        colon = item.find(":")
+        if colon < 0:
             continue
-        market, symbol = pair.split(":", 1)
-        market = market.strip().upper()
-        symbol = symbol.strip().upper()
+        market = item[:colon].strip().upper()
+        symbol = item[colon + 1 :].strip().upper()
         if market and symbol:
             out[market] = symbol
     return out
@@ -323,8 +498,12 @@ def get_fill_result_for_row(
     progress_round_col: int,
     symbol_hint: str = "",
 ) -> FillResult:
-    sell_qty = get_numeric_cell_value_or_none(ws, f"{col_to_a1(total_qty_col)}{target_row}")
-    round_raw = ws.acell(f"{col_to_a1(progress_round_col)}{target_row}", value_render_option="UNFORMATTED_VALUE").value
+    qty_a1 = f"{col_to_a1(total_qty_col)}{target_row}"
+    round_a1 = f"{col_to_a1(progress_round_col)}{target_row}"
+    qty_raw, round_raw, r6, b2, r9, r10, r11 = get_cell_values(
+        ws, [qty_a1, round_a1, "R6", "B2", "R9", "R10", "R11"]
+    )
+    sell_qty = parse_numeric_cell_or_none(qty_a1, qty_raw)
     if isinstance(round_raw, float) and round_raw.is_integer():
         round_text = str(int(round_raw))
     elif round_raw is None:
@@ -336,11 +515,11 @@ def get_fill_result_for_row(
         spreadsheet_title=sh_title,
         currency=ccy,
         current_round=round_text,
-        avg_price_r6=get_numeric_cell_value(ws, "R6"),
-        current_price_b2=get_numeric_cell_value(ws, "B2"),
-        buy_loc_avg_r9=get_numeric_cell_value(ws, "R9"),
-        buy_loc_high_r10=get_numeric_cell_value(ws, "R10"),
-        sell_all_r11=get_numeric_cell_value(ws, "R11"),
+        avg_price_r6=parse_numeric_cell("R6", r6),
+        current_price_b2=parse_numeric_cell("B2", b2),
+        buy_loc_avg_r9=parse_numeric_cell("R9", r9),
+        buy_loc_high_r10=parse_numeric_cell("R10", r10),
+        sell_all_r11=parse_numeric_cell("R11", r11),
         sell_qty_current_round=sell_qty if sell_qty is not None else 0.0,
     )
 
@@ -378,43 +557,80 @@ def build_upbit_command_result_text(processed_count: int, written_count: int, re
 
 def parse_sell_complete_message(text: str) -> Optional[str]:
     """Parse 'SYMBOL 매도 완료' message. Returns symbol or None."""
-    m = re.match(r"^\s*([A-Za-z0-9_-]+)\s+매도\s*완료\s*$", text.strip())
+    if "매도" not in text:
+        return None
+    m = _SELL_COMPLETE_RE.match(text.strip())
     if not m:
         return None
     return m.group(1).strip().upper()
 
 
-def parse_upbit_symbol_command(
-    text: str,
-    command_prefix: str,
-    tz_name: str,
-) -> Optional[Tuple[str, date, bool]]:
+@functools.lru_cache(maxsize=16)
+def _upbit_command_pattern(command_prefix: str) -> "re.Pattern[str]":
     # Examples:
     # - 업비트 BTC 기록
     # - 업비트 BTC 기록 : 2026-02-20
-    pattern = (
+    return re.compile(
         rf"^\s*{re.escape(command_prefix)}\s+([A-Za-z0-9_-]+)\s+기록"
         rf"(?:\s*:\s*(\d{{2,4}}-\d{{2}}-\d{{2}}))?\s*$"
     )
-    m = re.match(pattern, text.strip())
+
+
+def parse_upbit_symbol_command(
+    text: str,
+    command_prefix: str,
+    tz_name: str,
+) -> Optional[Tuple[str, date, bool]]:
+    # Cheap substring reject before strip()+regex; most chat messages are not commands.
+    if command_prefix not in text or "기록" not in text:
+        return None
+    m = _upbit_command_pattern(command_prefix).match(text.strip())
     if not m:
         return None
     symbol = m.group(1).strip().upper()
     d = m.group(2)
     if not d:
-        return symbol, datetime.now(ZoneInfo(tz_name)).date(), False
+        return symbol, datetime.now(_tz(tz_name)).date(), False
     if len(d.split("-", 1)[0]) == 2:
         yy, mm, dd = d.split("-")
         d = f"20{yy}-{mm}-{dd}"
     return symbol, datetime.strptime(d, "%Y-%m-%d").date(), True
 
 
-def upbit_auth_headers(access_key: str, secret_key: str, params: Dict[str, str]) -> Dict[str, str]:
+if _ciso8601_parse_datetime is not None:
+
+    def parse_iso_timestamp(ts) -> datetime:
+        # C parser; handles the trailing "Z" itself.
+        return _ciso8601_parse_datetime(str(ts))
+
+elif sys.version_info >= (3, 11):
+
+    def parse_iso_timestamp(ts) -> datetime:
+        # 3.11+ fromisoformat accepts the trailing "Z" natively.
+        return datetime.fromisoformat(str(ts))
+
+else:
+
+    def parse_iso_timestamp(ts) -> datetime:
+        return datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+
+
+def build_upbit_query(params: Dict) -> str:
+    # Unencoded "k=v&k[]=a&k[]=b" form; Upbit hashes exactly this string, so it is also what gets sent.
+    parts: List[str] = []
+    for k, v in params.items():
+        if isinstance(v, (list, tuple)):
+            parts.extend(f"{k}={x}" for x in v)
+        else:
+            parts.append(f"{k}={v}")
+    return "&".join(parts)
+
+
+def upbit_auth_headers(access_key: str, secret_key: str, query: str) -> Dict[str, str]:
     # Upbit query_hash must match the exact query-string encoding.
-    query = unquote(urlencode(params, doseq=True))
     payload = {
         "access_key": access_key,
-        "nonce": str(uuid.uuid4()),
+        "nonce": f"{time.time_ns()}-{next(_UPBIT_NONCE_COUNTER)}",
         "query_hash": hashlib.sha512(query.encode("utf-8")).hexdigest(),
         "query_hash_alg": "SHA512",
     }
@@ -422,6 +638,69 @@ def upbit_auth_headers(access_key: str, secret_key: str, params: Dict[str, str])
     return {"Authorization": f"Bearer {token}"}
 
 
+def fetch_upbit_orders_page(
+    page: int,
+    access_key: str,
+    secret_key: str,
+    base_url: str,
+    orders_path: str,
+) -> List[Dict]:
+    # Include both fully-filled(done) and canceled-with-executions(cancel) orders.
+    query = build_upbit_query(
+        {"states[]": ["done", "cancel"], "page": str(page), "limit": str(UPBIT_PAGE_LIMIT), "order_by": "desc"}
+    )
+    headers = upbit_auth_headers(access_key, secret_key, query)
+    timeout = (HTTP_CONNECT_TIMEOUT, 20)
+    resp = _HTTP.get(f"{base_url}{orders_path}", params=query, headers=headers, timeout=timeout)
+    if resp.status_code in {404, 405} and orders_path != "/v1/orders":
+        # Backward compatibility fallback.
+        resp = _HTTP.get(f"{base_url}/v1/orders", params=query, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    return json_loads(resp.content)
+
+
+def iter_upbit_order_pages(
+    access_key: str,
+    secret_key: str,
+    base_url: str,
+    orders_path: str,
+    max_pages: int,
+) -> Iterator[List[Dict]]:
+    """Yield non-empty order pages in page order, stopping at the first empty or short page.
+
+    Page 1 is probed alone; later pages are fetched UPBIT_FETCH_WORKERS at a time in parallel.
+    """
+    fetch = functools.partial(
+        fetch_upbit_orders_page,
+        access_key=access_key,
+        secret_key=secret_key,
+        base_url=base_url,
+        orders_path=orders_path,
+    )
+    if max_pages < 1:
+        return
+    rows = fetch(1)
+    if not rows:
+        return
+    yield rows
+    if len(rows) < UPBIT_PAGE_LIMIT:
+        return
+
+    next_page = 2
+    with ThreadPoolExecutor(max_workers=UPBIT_FETCH_WORKERS) as pool:
+        while next_page <= max_pages:
+            batch = range(next_page, min(next_page + UPBIT_FETCH_WORKERS, max_pages + 1))
+            futures = [pool.submit(fetch, p) for p in batch]
+            for fut in futures:
+                rows = fut.result()
+                if not rows:
+                    return
+                yield rows
+                if len(rows) < UPBIT_PAGE_LIMIT:
+                    return
+            next_page += len(batch)
+
+
 def fetch_upbit_fills_for_date(
     tz_name: str,
     target_date: date,
@@ -430,30 +709,20 @@ def fetch_upbit_fills_for_date(
     market_filter: str = "",
     base_url: str = "https://api.upbit.com",
     orders_path: str = "/v1/orders/closed",
+    max_pages: int = 30,
 ) -> List[UpbitFill]:
-    page = 1
     out: List[UpbitFill] = []
-    max_pages = int(os.getenv("UPBIT_MAX_PAGES", "30"))
     total_rows = 0
+    pages = 0
     skip_market = 0
     skip_qty = 0
     skip_amount = 0
     skip_date = 0
     skip_side = 0
-    while True:
-        if page > max_pages:
-            break
-        # Include both fully-filled(done) and canceled-with-executions(cancel) orders.
-        params = {"states[]": ["done", "cancel"], "page": str(page), "limit": "100", "order_by": "desc"}
-        headers = upbit_auth_headers(access_key, secret_key, params)
-        resp = requests.get(f"{base_url}{orders_path}", params=params, headers=headers, timeout=20)
-        if resp.status_code in {404, 405} and orders_path != "/v1/orders":
-            # Backward compatibility fallback.
-            resp = requests.get(f"{base_url}/v1/orders", params=params, headers=headers, timeout=20)
-        resp.raise_for_status()
-        rows = resp.json()
-        if not rows:
-            break
+    tz = _tz(tz_name)
+    market_filter_upper = market_filter.upper()
+    for rows in iter_upbit_order_pages(access_key, secret_key, base_url, orders_path, max_pages):
+        pages += 1
         total_rows += len(rows)
         for row in rows:
             done_ts = row.get("done_at")
@@ -461,27 +730,21 @@ def fetch_upbit_fills_for_date(
             if not done_ts and not created_ts:
                 continue
 
-            done_dt = (
-                datetime.fromisoformat(str(done_ts).replace("Z", "+00:00")).astimezone(ZoneInfo(tz_name))
-                if done_ts
-                else None
-            )
-            created_dt = (
-                datetime.fromisoformat(str(created_ts).replace("Z", "+00:00")).astimezone(ZoneInfo(tz_name))
-                if created_ts
-                else None
-            )
-
-            done_date = done_dt.date() if done_dt else None
-            created_date = created_dt.date() if created_dt else None
-            if target_date not in {done_date, created_date}:
-                skip_date += 1
-                continue
+            # Parse created_at only when done_at is missing or falls on another date.
+            done_dt = parse_iso_timestamp(done_ts).astimezone(tz) if done_ts else None
+            if done_dt is not None and done_dt.date() == target_date:
+                trade_dt = done_dt
+            else:
+                created_dt = parse_iso_timestamp(created_ts).astimezone(tz) if created_ts else None
+                if created_dt is None or created_dt.date() != target_date:
+                    skip_date += 1
+                    continue
+                trade_dt = done_dt or created_dt
             market = str(row.get("market", ""))
             if not market:
                 skip_market += 1
                 continue
-            if market_filter and market.upper() != market_filter.upper():
+            if market_filter_upper and market.upper() != market_filter_upper:
                 skip_market += 1
                 continue
             side = str(row.get("side", ""))
@@ -509,7 +772,6 @@ def fetch_upbit_fills_for_date(
                 price = amount / qty
             else:
                 price = raw_price if raw_price > 0 else (amount / qty)
-            trade_dt = done_dt or created_dt
             fill_id = str(row.get("uuid") or f"{market}:{trade_dt.isoformat()}:{qty}:{price}")
             out.append(
                 UpbitFill(
@@ -522,23 +784,41 @@ def fetch_upbit_fills_for_date(
                     amount=amount,
                 )
             )
-        page += 1
     log(
         f"upbit_fetch_done target_date={target_date.isoformat()} market={market_filter} "
         f"rows={total_rows} fills={len(out)} skip_date={skip_date} "
-        f"skip_market={skip_market} skip_side={skip_side} skip_qty={skip_qty} skip_amount={skip_amount} pages={page-1}"
+        f"skip_market={skip_market} skip_side={skip_side} skip_qty={skip_qty} skip_amount={skip_amount} pages={pages}"
     )
     return out
 
 
+# Opened spreadsheets/worksheets are reused for the life of the process; each open is a metadata round-trip.
+_SPREADSHEET_CACHE: Dict[Tuple[int, str], gspread.Spreadsheet] = {}
+_WORKSHEET_CACHE: Dict[Tuple[str, str], gspread.Worksheet] = {}
+# (spreadsheet id, worksheet id) -> (header layout, label cells). The label cells are re-read with every
+# fill so an inserted/deleted row or column is noticed and the sheet is re-scanned.
+_SHEET_LAYOUT_CACHE: Dict[
+    Tuple[str, int], Tuple[Tuple[int, int, int, int, int, int], List[Tuple[str, Callable[[str], bool]]]]
+] = {}
+
+
 def resolve_spreadsheet(gc: gspread.Client, symbol: str, spreadsheet_id_map: Dict[str, str]):
+    key = (id(gc), symbol.upper())
+    sh = _SPREADSHEET_CACHE.get(key)
+    if sh is not None:
+        return sh
+
     sheet_id = spreadsheet_id_map.get(symbol.upper())
     if sheet_id:
-        return gc.open_by_key(sheet_id)
+        sh = gc.open_by_key(sheet_id)
+        _SPREADSHEET_CACHE[key] = sh
+        return sh
 
     fallback_by_title = os.getenv("FALLBACK_OPEN_BY_TITLE", "false").lower().strip() in {"1", "true", "yes", "on"}
     if fallback_by_title:
-        return gc.open(f"{symbol} 무한매수")
+        sh = gc.open(f"{symbol} 무한매수")
+        _SPREADSHEET_CACHE[key] = sh
+        return sh
 
     raise ValueError(
         f"스프레드시트 매핑에 {symbol} 키가 없습니다. "
@@ -546,6 +826,15 @@ def resolve_spreadsheet(gc: gspread.Client, symbol: str, spreadsheet_id_map: Dic
     )
 
 
+def resolve_worksheet(sh: gspread.Spreadsheet, worksheet_name: str) -> gspread.Worksheet:
+    key = (sh.id, worksheet_name)
+    ws = _WORKSHEET_CACHE.get(key)
+    if ws is None:
+        ws = sh.worksheet(worksheet_name) if worksheet_name else sh.get_worksheet(0)
+        _WORKSHEET_CACHE[key] = ws
+    return ws
+
+
 def process_sell_complete(
     gc: gspread.Client,
     symbol: str,
@@ -564,13 +853,9 @@ def process_sell_complete(
         raise ValueError("RESULT_SPREADSHEET_ID 가 설정되지 않았습니다.")
 
     # 1) 무한매수 시트 열기 & 요약 데이터 읽기
-    sh = resolve_spreadsheet(gc, symbol, spreadsheet_id_map)
+    sh, ws, layout, date_values = open_sheet_layout(gc, symbol, worksheet_name, spreadsheet_id_map)
     ensure_spreadsheet_backup_once(sh, backup_dir, backup_cache, backup_context, symbol)
-    ws = sh.worksheet(worksheet_name) if worksheet_name else sh.get_worksheet(0)
-
-    values = ws.get_all_values()
-    header_row, date_col, loc_avg_col, loc_high_col = find_header_row_and_columns(values)
-    total_qty_col = find_total_qty_column(values, header_row, loc_high_col)
+    header_row, date_col, _, loc_high_col, total_qty_col, _ = layout
 
     # R11 = 지정가매도 가격
     sell_price_r11 = get_numeric_cell_value(ws, "R11")
@@ -593,9 +878,7 @@ def process_sell_complete(
     # 기간: 데이터 행에서 첫 날짜 ~ 마지막 날짜
     first_date = None
     last_date = None
-    for r_idx in range(header_row + 1, len(values) + 1):
-        row = values[r_idx - 1]
-        raw = row[date_col - 1] if len(row) >= date_col else ""
+    for raw in date_values:
         parsed = normalize_date_value(raw)
         if parsed:
             if first_date is None:
@@ -651,13 +934,14 @@ def process_sell_complete(
     )
 
 
+@functools.lru_cache(maxsize=1024)
 def col_to_a1(col_idx: int) -> str:
-    chars: List[str] = []
+    s = ""
     n = col_idx
     while n > 0:
         n, rem = divmod(n - 1, 26)
-        chars.append(chr(ord("A") + rem))
-    return "".join(reversed(chars))
+        s = _COLUMN_LETTERS[rem] + s
+    return s
 
 
 def normalize_date_value(value: str) -> Optional[datetime.date]:
@@ -671,7 +955,7 @@ def normalize_date_value(value: str) -> Optional[datetime.date]:
         except ValueError:
             continue
 
-    m = re.match(r"^(\d{4})-(\d{1,2})-(\d{1,2})$", value)
+    m = _ISO_RE.match(value)
     if m:
         return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3))).date()
 
@@ -679,24 +963,31 @@ def normalize_date_value(value: str) -> Optional[datetime.date]:
 
 
 def _norm_label(text: str) -> str:
-    s = str(text or "").strip().lower()
-    s = re.sub(r"\s+", "", s)
-    return s
-
+    if not text:
+        return ""
+    # str.split() drops the same unicode whitespace as r"\s+" without going through the regex engine.
+    return "".join(str(text).lower().split())
 
-def _is_date_label(text: str) -> bool:
-    n = _norm_label(text)
-    return "날짜" in n or "체결일자" in n
 
-
-def _is_loc_avg_label(text: str) -> bool:
-    n = _norm_label(text)
-    return "loc평단" in n or ("loc" in n and "평단" in n)
+_LABEL_DATE = 1
+_LABEL_LOC_AVG = 2
+_LABEL_LOC_HIGH = 4
 
 
-def _is_loc_high_label(text: str) -> bool:
+def _label_flags(text: str) -> int:
+    # Classify a header cell with a single normalization; bit flags because one cell may match several labels.
     n = _norm_label(text)
-    return "loc고가" in n or ("loc" in n and "고가" in n)
+    if not n:
+        return 0
+    flags = 0
+    if "날짜" in n or "체결일자" in n:
+        flags |= _LABEL_DATE
+    if "loc" in n:
+        if "평단" in n:
+            flags |= _LABEL_LOC_AVG
+        if "고가" in n:
+            flags |= _LABEL_LOC_HIGH
+    return flags
 
 
 def _is_total_qty_label(text: str) -> bool:
@@ -714,14 +1005,25 @@ def find_header_row_and_columns(values: List[List[str]]) -> Tuple[int, int, int,
     if not values:
         raise ValueError("시트가 비어 있습니다")
 
-    max_col = max(len(r) for r in values)
     row_count = len(values)
+    # Per-row label flags, classified lazily so each cell is normalized at most once across both passes.
+    row_flags: List[Optional[List[int]]] = [None] * row_count
+
+    def flags_of(r: int) -> List[int]:
+        flags = row_flags[r - 1]
+        if flags is None:
+            flags = row_flags[r - 1] = [_label_flags(cell) for cell in values[r - 1]]
+        return flags
 
     # 1) 날짜 라벨을 기준으로 주변에서 LOC 라벨을 찾는다.
     for r in range(1, row_count + 1):
         row = values[r - 1]
+        # Cheap reject: every date label ("날짜"/"체결일자") contains 날 or 일.
+        joined = "".join(row)
+        if "날" not in joined and "일" not in joined:
+            continue
         for c in range(1, len(row) + 1):
-            if not _is_date_label(row[c - 1]):
+            if not flags_of(r)[c - 1] & _LABEL_DATE:
                 continue
 
             loc_avg = None
@@ -730,13 +1032,13 @@ def find_header_row_and_columns(values: List[List[str]]) -> Tuple[int, int, int,
             loc_high_row = r
 
             for rr in range(r, min(r + 2, row_count) + 1):
-                scan_row = values[rr - 1]
-                for cc in range(c + 1, min(c + 14, max_col) + 1):
-                    cell = scan_row[cc - 1] if cc - 1 < len(scan_row) else ""
-                    if (loc_avg is None) and _is_loc_avg_label(cell):
+                scan_flags = flags_of(rr)
+                for cc in range(c + 1, min(c + 14, len(scan_flags)) + 1):
+                    cell_flags = scan_flags[cc - 1]
+                    if (loc_avg is None) and cell_flags & _LABEL_LOC_AVG:
                         loc_avg = cc
                         loc_avg_row = rr
-                    if (loc_high is None) and _is_loc_high_label(cell):
+                    if (loc_high is None) and cell_flags & _LABEL_LOC_HIGH:
                         loc_high = cc
                         loc_high_row = rr
                 if loc_avg is not None and loc_high is not None:
@@ -749,12 +1051,12 @@ def find_header_row_and_columns(values: List[List[str]]) -> Tuple[int, int, int,
     loc_avg_row = None
     loc_high_row = None
     for r in range(1, row_count + 1):
-        row = values[r - 1]
-        for c in range(1, len(row) + 1):
-            cell = row[c - 1]
-            if loc_avg_col is None and _is_loc_avg_label(cell):
+        row_flags_r = flags_of(r)
+        for c in range(1, len(row_flags_r) + 1):
+            cell_flags = row_flags_r[c - 1]
+            if loc_avg_col is None and cell_flags & _LABEL_LOC_AVG:
                 loc_avg_col, loc_avg_row = c, r
-            if loc_high_col is None and _is_loc_high_label(cell):
+            if loc_high_col is None and cell_flags & _LABEL_LOC_HIGH:
                 loc_high_col, loc_high_row = c, r
         if loc_avg_col is not None and loc_high_col is not None:
             break
@@ -765,9 +1067,9 @@ def find_header_row_and_columns(values: List[List[str]]) -> Tuple[int, int, int,
             for rr in [base_r, base_r - 1, base_r + 1]:
                 if rr < 1 or rr > row_count:
                     continue
-                scan_row = values[rr - 1]
-                for c in range(1, len(scan_row) + 1):
-                    if _is_date_label(scan_row[c - 1]):
+                scan_flags = flags_of(rr)
+                for c in range(1, len(scan_flags) + 1):
+                    if scan_flags[c - 1] & _LABEL_DATE:
                         header_row = max(rr, loc_avg_row or rr, loc_high_row or rr)
                         return header_row, c, loc_avg_col, loc_high_col
 
@@ -800,30 +1102,120 @@ def find_progress_round_column(values: List[List[str]], header_row: int, date_co
     return max(1, date_col - 1)
 
 
-def find_or_create_date_row(
-    ws: gspread.Worksheet,
-    values: List[List[str]],
-    header_row: int,
-    date_col: int,
-    target_date,
-    target_date_text: str,
-) -> int:
-    # find existing date row
-    for r_idx in range(header_row + 1, len(values) + 1):
-        row = values[r_idx - 1]
-        raw = row[date_col - 1] if len(row) >= date_col else ""
-        parsed = normalize_date_value(raw)
-        if parsed and parsed == target_date:
-            return r_idx
+def _is_date_label(text: str) -> bool:
+    return bool(_label_flags(text) & _LABEL_DATE)
+
+
+def _is_loc_avg_label(text: str) -> bool:
+    return bool(_label_flags(text) & _LABEL_LOC_AVG)
+
+
+def _is_loc_high_label(text: str) -> bool:
+    return bool(_label_flags(text) & _LABEL_LOC_HIGH)
+
+
+def _find_label_cell(
+    values: List[List[str]], rows: List[int], col: int, is_label: Callable[[str], bool]
+) -> Optional[Tuple[str, Callable[[str], bool]]]:
+    # First of `rows` whose cell in `col` is the label; returned as (A1, check) for later validation.
+    for rr in rows:
+        if 1 <= rr <= len(values) and len(values[rr - 1]) >= col and is_label(values[rr - 1][col - 1]):
+            return f"{col_to_a1(col)}{rr}", is_label
+    return None
+
+
+def load_sheet_layout(ws: gspread.Worksheet) -> Tuple[Tuple[int, int, int, int, int, int], List[str]]:
+    """Return the worksheet header layout and the date-column cells below the header.
+
+    The layout is (header_row, date_col, loc_avg_col, loc_high_col, total_qty_col, progress_round_col).
+    It is scanned from the full sheet once per worksheet; later calls fetch the date column together
+    with the header label cells, and re-scan if any label is no longer where it was.
+    """
+    key = (ws.spreadsheet.id, ws.id)
+    cached = _SHEET_LAYOUT_CACHE.get(key)
+    if cached is not None:
+        layout, label_cells = cached
+        header_row, date_col = layout[0], layout[1]
+        date_a1 = col_to_a1(date_col)
+        value_ranges = ws.batch_get([f"{date_a1}{header_row + 1}:{date_a1}"] + [a1 for a1, _ in label_cells])
+        labels_ok = True
+        for (a1, is_label), vr in zip(label_cells, value_ranges[1:]):
+            text = vr[0][0] if vr and vr[0] else ""
+            if not is_label(str(text)):
+                labels_ok = False
+                break
+        if labels_ok:
+            return layout, [row[0] if row else "" for row in value_ranges[0]]
+        log(f"sheet_layout_changed title={ws.title} label={a1}")
+        _SHEET_LAYOUT_CACHE.pop(key, None)
+
+    values = ws.get_all_values()
+    header_row, date_col, loc_avg_col, loc_high_col = find_header_row_and_columns(values)
+    total_qty_col = find_total_qty_column(values, header_row, loc_high_col)
+    progress_round_col = find_progress_round_column(values, header_row, date_col)
+    layout = (header_row, date_col, loc_avg_col, loc_high_col, total_qty_col, progress_round_col)
+    # Labels sit on or above header_row; 총수량/진행회차 may also be found one row below.
+    upward = list(range(header_row, 0, -1))
+    nearby = [header_row, header_row - 1, header_row + 1]
+    candidates = [
+        _find_label_cell(values, upward, date_col, _is_date_label),
+        _find_label_cell(values, upward, loc_avg_col, _is_loc_avg_label),
+        _find_label_cell(values, upward, loc_high_col, _is_loc_high_label),
+        _find_label_cell(values, nearby, total_qty_col, _is_total_qty_label),
+        _find_label_cell(values, nearby, progress_round_col, _is_progress_round_label),
+    ]
+    _SHEET_LAYOUT_CACHE[key] = (layout, [cell for cell in candidates if cell is not None])
+    return layout, [row[date_col - 1] if len(row) >= date_col else "" for row in values[header_row:]]
+
+
+def invalidate_sheet_caches() -> None:
+    # Drop every cached spreadsheet handle and layout; the next fill re-resolves from scratch.
+    _SPREADSHEET_CACHE.clear()
+    _WORKSHEET_CACHE.clear()
+    _SHEET_LAYOUT_CACHE.clear()
+
+
+def open_sheet_layout(
+    gc: gspread.Client,
+    symbol: str,
+    worksheet_name: str,
+    spreadsheet_id_map: Dict[str, str],
+) -> Tuple[gspread.Spreadsheet, gspread.Worksheet, Tuple[int, int, int, int, int, int], List[str]]:
+    """Resolve the symbol's spreadsheet/worksheet from cache and read its layout.
+
+    The first read goes through the cached handles; if it fails with an APIError (sheet deleted,
+    renamed, moved), the caches are dropped and everything is re-opened once before giving up.
+    Nothing has been written at this point, so the retry is safe.
+    """
+    sh = resolve_spreadsheet(gc, symbol, spreadsheet_id_map)
+    ws = resolve_worksheet(sh, worksheet_name)
+    try:
+        layout, date_values = load_sheet_layout(ws)
+    except gspread.exceptions.APIError:
+        invalidate_sheet_caches()
+        sh = resolve_spreadsheet(gc, symbol, spreadsheet_id_map)
+        ws = resolve_worksheet(sh, worksheet_name)
+        layout, date_values = load_sheet_layout(ws)
+    return sh, ws, layout, date_values
+
+
+def find_date_row(date_values: List[str], header_row: int, target_date) -> Tuple[int, bool]:
+    # returns: (row, is_new). For a new row the caller writes the date cell together with the fill
+    # values, so creating a day costs no extra API call.
+    # find existing date row, remembering the first empty date cell on the way
+    first_empty_offset = None
+    for offset, raw in enumerate(date_values):
+        if is_blank_cell(raw):
+            if first_empty_offset is None:
+                first_empty_offset = offset
+            continue
+        if normalize_date_value(raw) == target_date:
+            return header_row + 1 + offset, False
 
     # create in first empty date cell below header
-    r_idx = header_row + 1
-    while True:
-        raw = ws.acell(f"{col_to_a1(date_col)}{r_idx}").value
-        if not str(raw or "").strip():
-            ws.update(range_name=f"{col_to_a1(date_col)}{r_idx}", values=[[target_date_text]])
-            return r_idx
-        r_idx += 1
+    if first_empty_offset is None:
+        first_empty_offset = len(date_values)
+    return header_row + 1 + first_empty_offset, True
 
 
 def is_blank_cell(value) -> bool:
@@ -845,23 +1237,20 @@ def process_fill_to_sheet(
     if msg.fill_qty < 0:
         return None
 
-    sh = resolve_spreadsheet(gc, msg.symbol, spreadsheet_id_map)
+    sh, ws, layout, date_values = open_sheet_layout(gc, msg.symbol, worksheet_name, spreadsheet_id_map)
     ensure_spreadsheet_backup_once(sh, backup_dir, backup_cache, backup_context, msg.symbol)
-    ws = sh.worksheet(worksheet_name) if worksheet_name else sh.get_worksheet(0)
-
-    values = ws.get_all_values()
-    header_row, date_col, loc_avg_col, loc_high_col = find_header_row_and_columns(values)
-    total_qty_col = find_total_qty_column(values, header_row, loc_high_col)
-    progress_round_col = find_progress_round_column(values, header_row, date_col)
+    header_row, date_col, loc_avg_col, loc_high_col, total_qty_col, progress_round_col = layout
 
-    year = datetime.now(ZoneInfo(tz_name)).year
+    year = datetime.now(_tz(tz_name)).year
     target_date = datetime(year, msg.fill_month, msg.fill_day).date()
     target_date_text = f"{year}-{msg.fill_month:02d}-{msg.fill_day:02d}"
 
-    target_row = find_or_create_date_row(ws, values, header_row, date_col, target_date, target_date_text)
+    target_row, new_row = find_date_row(date_values, header_row, target_date)
+    date_cells = [(date_col, target_date_text)] if new_row else []
 
-    avg_price = get_numeric_cell_value_or_none(ws, "R6")
-    half_round_amount = get_numeric_cell_value(ws, "B3")
+    r6, b3 = get_cell_values(ws, ["R6", "B3"])
+    avg_price = parse_numeric_cell_or_none("R6", r6)
+    half_round_amount = parse_numeric_cell("B3", b3)
     fill_amount = msg.fill_price * msg.fill_qty
     ratio_full = fill_amount / (half_round_amount * 2) if half_round_amount > 0 else 0
 
@@ -871,18 +1260,22 @@ def process_fill_to_sheet(
             f"sheet_write symbol={msg.symbol} row={target_row} "
             f"mode=avg_no_r6 (R6 empty → LOC평단 + LOC고가 qty=0)"
         )
-        ws.update(range_name=f"{col_to_a1(loc_avg_col)}{target_row}", values=[[msg.fill_price]])
-        ws.update(range_name=f"{col_to_a1(loc_avg_col + 1)}{target_row}", values=[[msg.fill_qty]])
-        ws.update(range_name=f"{col_to_a1(loc_high_col + 1)}{target_row}", values=[[0]])
+        update_row_cells(
+            ws,
+            target_row,
+            date_cells + [(loc_avg_col, msg.fill_price), (loc_avg_col + 1, msg.fill_qty), (loc_high_col + 1, 0)],
+        )
     elif 0.8 <= ratio_full <= 1.2:
         log(
             f"sheet_write symbol={msg.symbol} row={target_row} "
             f"mode=avg_with_zero_high fill_amount={fill_amount:.4f} ratio_full={ratio_full:.4f}"
         )
-        ws.update(range_name=f"{col_to_a1(loc_avg_col)}{target_row}", values=[[msg.fill_price]])
-        ws.update(range_name=f"{col_to_a1(loc_avg_col + 1)}{target_row}", values=[[msg.fill_qty]])
-        ws.update(range_name=f"{col_to_a1(loc_high_col)}{target_row}", values=[[0]])
-        ws.update(range_name=f"{col_to_a1(loc_high_col + 1)}{target_row}", values=[[0]])
+        update_row_cells(
+            ws,
+            target_row,
+            date_cells
+            + [(loc_avg_col, msg.fill_price), (loc_avg_col + 1, msg.fill_qty), (loc_high_col, 0), (loc_high_col + 1, 0)],
+        )
     else:
         if msg.fill_price <= avg_price:
             price_col = loc_avg_col
@@ -890,9 +1283,12 @@ def process_fill_to_sheet(
             price_col = loc_high_col
         # Same-date fallback rule:
         # If LOC평단 already has a value and LOC고가 is empty, write this buy into LOC고가.
-        if price_col == loc_avg_col:
-            avg_existing = ws.acell(f"{col_to_a1(loc_avg_col)}{target_row}").value
-            high_existing = ws.acell(f"{col_to_a1(loc_high_col)}{target_row}").value
+        if price_col == loc_avg_col and not new_row:
+            avg_existing, high_existing = get_cell_values(
+                ws,
+                [f"{col_to_a1(loc_avg_col)}{target_row}", f"{col_to_a1(loc_high_col)}{target_row}"],
+                value_render_option=None,
+            )
             if (not is_blank_cell(avg_existing)) and is_blank_cell(high_existing):
                 price_col = loc_high_col
         qty_col = price_col + 1
@@ -902,8 +1298,7 @@ def process_fill_to_sheet(
             f"sheet_write symbol={msg.symbol} row={target_row} "
             f"zone={target_zone} price_col={col_to_a1(price_col)} qty_col={col_to_a1(qty_col)}"
         )
-        ws.update(range_name=f"{col_to_a1(price_col)}{target_row}", values=[[msg.fill_price]])
-        ws.update(range_name=f"{col_to_a1(qty_col)}{target_row}", values=[[msg.fill_qty]])
+        update_row_cells(ws, target_row, date_cells + [(price_col, msg.fill_price), (qty_col, msg.fill_qty)])
     return get_fill_result_for_row(
         ws,
         sh.title,
@@ -927,16 +1322,13 @@ def process_upbit_fill_to_sheet(
 ) -> Optional[FillResult]:
     if fill.side != "bid":
         return None
-    sh = resolve_spreadsheet(gc, target_symbol, spreadsheet_id_map)
+    sh, ws, layout, date_values = open_sheet_layout(gc, target_symbol, worksheet_name, spreadsheet_id_map)
     ensure_spreadsheet_backup_once(sh, backup_dir, backup_cache, backup_context, target_symbol)
-    ws = sh.worksheet(worksheet_name) if worksheet_name else sh.get_worksheet(0)
-    values = ws.get_all_values()
-    header_row, date_col, loc_avg_col, loc_high_col = find_header_row_and_columns(values)
-    total_qty_col = find_total_qty_column(values, header_row, loc_high_col)
-    progress_round_col = find_progress_round_column(values, header_row, date_col)
+    header_row, date_col, loc_avg_col, loc_high_col, total_qty_col, progress_round_col = layout
 
-    half_round_usd = get_numeric_cell_value(ws, "B3")
-    avg_price = get_numeric_cell_value_or_none(ws, "R6")
+    b3, r6 = get_cell_values(ws, ["B3", "R6"])
+    half_round_usd = parse_numeric_cell("B3", b3)
+    avg_price = parse_numeric_cell_or_none("R6", r6)
     ratio_half = fill.amount / half_round_usd if half_round_usd > 0 else 0
     ratio_full = fill.amount / (half_round_usd * 2) if half_round_usd > 0 else 0
     log(
@@ -944,34 +1336,32 @@ def process_upbit_fill_to_sheet(
         f"b3={half_round_usd:.4f} ratio_half={ratio_half:.4f} ratio_full={ratio_full:.4f}"
     )
 
+    target_date = fill.trade_time.date()
+    target_row, new_row = find_date_row(date_values, header_row, target_date)
+    date_cells = [(date_col, target_date.strftime("%Y-%m-%d"))] if new_row else []
+
     if avg_price is None:
         # 1회차 등 평단가가 아직 없는 경우 비교 없이 LOC평단에 기록, LOC고가 수량=0
-        target_date = fill.trade_time.date()
-        target_date_text = target_date.strftime("%Y-%m-%d")
-        target_row = find_or_create_date_row(ws, values, header_row, date_col, target_date, target_date_text)
         log(
             f"upbit_sheet_write mode=avg_no_r6 row={target_row} price={fill.price} qty={fill.qty} "
             f"(R6 empty → LOC평단 + LOC고가 qty=0)"
         )
-        ws.update(range_name=f"{col_to_a1(loc_avg_col)}{target_row}", values=[[fill.price]])
-        ws.update(range_name=f"{col_to_a1(loc_avg_col + 1)}{target_row}", values=[[fill.qty]])
-        ws.update(range_name=f"{col_to_a1(loc_high_col + 1)}{target_row}", values=[[0]])
+        update_row_cells(
+            ws,
+            target_row,
+            date_cells + [(loc_avg_col, fill.price), (loc_avg_col + 1, fill.qty), (loc_high_col + 1, 0)],
+        )
     elif 0.8 <= ratio_full <= 1.2:
-        target_date = fill.trade_time.date()
-        target_date_text = target_date.strftime("%Y-%m-%d")
-        target_row = find_or_create_date_row(ws, values, header_row, date_col, target_date, target_date_text)
         log(
             f"upbit_sheet_write mode=avg_with_zero_high row={target_row} price={fill.price} qty={fill.qty} "
             f"ratio_full={ratio_full:.4f}"
         )
-        ws.update(range_name=f"{col_to_a1(loc_avg_col)}{target_row}", values=[[fill.price]])
-        ws.update(range_name=f"{col_to_a1(loc_avg_col + 1)}{target_row}", values=[[fill.qty]])
-        ws.update(range_name=f"{col_to_a1(loc_high_col)}{target_row}", values=[[0]])
-        ws.update(range_name=f"{col_to_a1(loc_high_col + 1)}{target_row}", values=[[0]])
+        update_row_cells(
+            ws,
+            target_row,
+            date_cells + [(loc_avg_col, fill.price), (loc_avg_col + 1, fill.qty), (loc_high_col, 0), (loc_high_col + 1, 0)],
+        )
     elif 0.8 <= ratio_half <= 1.2:
-        target_date = fill.trade_time.date()
-        target_date_text = target_date.strftime("%Y-%m-%d")
-        target_row = find_or_create_date_row(ws, values, header_row, date_col, target_date, target_date_text)
         if fill.price > avg_price:
             price_col = loc_high_col
             zone = "LOC고가"
@@ -982,8 +1372,7 @@ def process_upbit_fill_to_sheet(
             f"upbit_sheet_write mode=single row={target_row} zone={zone} price={fill.price} qty={fill.qty} "
             f"ratio_half={ratio_half:.4f}"
         )
-        ws.update(range_name=f"{col_to_a1(price_col)}{target_row}", values=[[fill.price]])
-        ws.update(range_name=f"{col_to_a1(price_col + 1)}{target_row}", values=[[fill.qty]])
+        update_row_cells(ws, target_row, date_cells + [(price_col, fill.price), (price_col + 1, fill.qty)])
     else:
         log(
             f"upbit_fill_skipped fill_id={fill.fill_id} amount={fill.amount:.4f} "
@@ -1006,7 +1395,7 @@ def process_upbit_fill_to_sheet(
 
 def run_upbit_sync_once(
     gc: gspread.Client,
-    state: Dict,
+    state: BotState,
     tz_name: str,
     target_date: date,
     worksheet_name: str,
@@ -1016,6 +1405,7 @@ def run_upbit_sync_once(
     upbit_sheet_symbol: str,
     upbit_base_url: str,
     upbit_orders_path: str,
+    upbit_max_pages: int,
     explicit_date: bool,
     spreadsheet_id_map: Dict[str, str],
     backup_dir: str,
@@ -1030,8 +1420,10 @@ def run_upbit_sync_once(
         market_filter=upbit_market,
         base_url=upbit_base_url,
         orders_path=upbit_orders_path,
+        max_pages=upbit_max_pages,
     )
-    processed_ids = set(state.get("processed_upbit_fill_ids", []))
+    # Insertion-ordered so the saved tail keeps the most recently processed ids.
+    processed_ids = dict.fromkeys(state.processed_upbit_fill_ids)
     new_fills = fills if explicit_date else [f for f in fills if f.fill_id not in processed_ids]
     if new_fills:
         markets = sorted({f.market for f in new_fills})
@@ -1053,30 +1445,51 @@ def run_upbit_sync_once(
             backup_cache=backup_cache,
             backup_context=backup_context,
         )
-        processed_ids.add(fill.fill_id)
+        processed_ids.pop(fill.fill_id, None)
+        processed_ids[fill.fill_id] = None
         if result:
             written_count += 1
             last_result = result
 
-    state["processed_upbit_fill_ids"] = list(sorted(processed_ids))[-1000:]
+    state.processed_upbit_fill_ids = list(processed_ids)[-1000:]
     return processed_count, written_count, last_result
 
 
-def load_state(path: Path) -> Dict:
+def load_state(path: Path) -> BotState:
     if not path.exists():
-        return {"last_update_id": 0, "processed_upbit_fill_ids": []}
+        return BotState()
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-        if "processed_upbit_fill_ids" not in data:
-            data["processed_upbit_fill_ids"] = []
-        return data
+        data = json_loads(path.read_bytes())
     except (json.JSONDecodeError, OSError):
-        return {"last_update_id": 0, "processed_upbit_fill_ids": []}
+        return BotState()
+    # Types are normalized once here; the update loop works on plain ints afterwards.
+    default_chat_id = data.get("default_chat_id")
+    return BotState(
+        last_update_id=int(data.get("last_update_id", 0)),
+        default_chat_id=int(default_chat_id) if default_chat_id is not None else None,
+        processed_upbit_fill_ids=[str(x) for x in data.get("processed_upbit_fill_ids", [])],
+        recent_update_ids=[int(x) for x in data.get("recent_update_ids", [])],
+    )
+
+
+# Last JSON bytes written per state file; lets idle poll cycles skip the rewrite.
+_SAVED_STATE_BYTES: Dict[Path, bytes] = {}
 
 
-def save_state(path: Path, state: Dict) -> None:
+def save_state(path: Path, state: BotState) -> None:
+    data = json_dumps_pretty(asdict(state))
+    if _SAVED_STATE_BYTES.get(path) == data:
+        return
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Write-then-rename so a crash mid-write never leaves a truncated state file. No fsync: os.replace gives
+    # atomicity, not durability. After an OS crash or power cut the file can roll back to an older version,
+    # losing last_update_id, recent_update_ids and processed_upbit_fill_ids together. Updates handled since
+    # the last durable write are then re-applied to the sheet (webhook redelivery, repeated Upbit command)
+    # or lost outright (polling: Telegram already deleted them). A plain process crash is not affected.
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    _SAVED_STATE_BYTES[path] = data
 
 
 def get_update_text(update: Dict) -> Optional[str]:
@@ -1090,14 +1503,44 @@ def get_update_text(update: Dict) -> Optional[str]:
 
 def fetch_updates(token: str, offset: int, timeout: int) -> List[Dict]:
     url = f"https://api.telegram.org/bot{token}/getUpdates"
-    resp = requests.get(url, params={"offset": offset, "timeout": timeout}, timeout=timeout + 10)
+    resp = _HTTP.get(
+        url,
+        params={"offset": offset, "timeout": timeout},
+        timeout=(HTTP_CONNECT_TIMEOUT, timeout + 10),
+    )
     resp.raise_for_status()
-    body = resp.json()
+    body = json_loads(resp.content)
     if not body.get("ok"):
         raise RuntimeError(f"telegram error: {body}")
     return body.get("result", [])
 
 
+def set_telegram_webhook(token: str, url: str, secret_token: str, drop_pending_updates: bool) -> None:
+    payload = {
+        "url": url,
+        "allowed_updates": TELEGRAM_ALLOWED_UPDATES,
+        "drop_pending_updates": drop_pending_updates,
+        # One delivery at a time: Telegram waits for each 200 before sending the next update, so they
+        # reach the worker in order.
+        "max_connections": 1,
+    }
+    if secret_token:
+        payload["secret_token"] = secret_token
+    url = f"https://api.telegram.org/bot{token}/setWebhook"
+    resp = _HTTP.post(url, data=json_dumps(payload), headers=_JSON_HEADERS, timeout=(HTTP_CONNECT_TIMEOUT, 15))
+    resp.raise_for_status()
+    body = json_loads(resp.content)
+    if not body.get("ok"):
+        raise RuntimeError(f"telegram error: {body}")
+
+
+def delete_telegram_webhook(token: str) -> None:
+    # getUpdates is rejected (409) while a webhook is registered, e.g. after switching back from webhook mode.
+    url = f"https://api.telegram.org/bot{token}/deleteWebhook"
+    resp = _HTTP.post(url, timeout=(HTTP_CONNECT_TIMEOUT, 15))
+    resp.raise_for_status()
+
+
 def get_update_chat_id(update: Dict) -> Optional[int]:
     for key in ["message", "edited_message", "channel_post", "edited_channel_post"]:
         part = update.get(key) or {}
@@ -1108,13 +1551,48 @@ def get_update_chat_id(update: Dict) -> Optional[int]:
     return None
 
 
-def send_telegram_message(token: str, chat_id: int, text: str) -> None:
+def send_telegram_message(token: str, chat_id: int, text: str, disable_notification: bool = False) -> None:
     url = f"https://api.telegram.org/bot{token}/sendMessage"
-    resp = requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=15)
+    payload = {"chat_id": chat_id, "text": text}
+    if disable_notification:
+        payload["disable_notification"] = True
+    resp = _HTTP.post(url, data=json_dumps(payload), headers=_JSON_HEADERS, timeout=(HTTP_CONNECT_TIMEOUT, 15))
     resp.raise_for_status()
     log(f"telegram_reply_sent chat_id={chat_id}")
 
 
+def split_telegram_text(texts: List[str], limit: int = TELEGRAM_MAX_MESSAGE_LEN) -> List[str]:
+    # Pack replies into as few messages as possible; a single oversized reply is cut at the limit.
+    chunks: List[str] = []
+    current = ""
+    for text in texts:
+        while len(text) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(text[:limit])
+            text = text[limit:]
+        if not text:
+            continue
+        if current and len(current) + 2 + len(text) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{text}" if current else text
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def flush_replies(token: str, replies: Dict[int, List[str]]) -> None:
+    for chat_id, texts in replies.items():
+        try:
+            for i, chunk in enumerate(split_telegram_text(texts)):
+                # Only the first message of a coalesced reply notifies the chat.
+                send_telegram_message(token, chat_id, chunk, disable_notification=i > 0)
+        except Exception as e:
+            log(f"telegram_reply_error chat_id={chat_id}: {e}")
+
+
 def build_app_config() -> AppConfig:
     tz_name = os.getenv("TIMEZONE", "Asia/Seoul")
     token = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
@@ -1140,9 +1618,18 @@ def build_app_config() -> AppConfig:
         upbit_market_sheet_map = {upbit_market.upper(): upbit_sheet_symbol}
     upbit_base_url = os.getenv("UPBIT_BASE_URL", "https://api.upbit.com").strip()
     upbit_orders_path = os.getenv("UPBIT_ORDERS_PATH", "/v1/orders").strip()
-    upbit_command_prefix = os.getenv("UPBIT_COMMAND_PREFIX", "업비트").strip()
+    upbit_max_pages = int(os.getenv("UPBIT_MAX_PAGES", "30"))
+    upbit_command_prefix = sys.intern(os.getenv("UPBIT_COMMAND_PREFIX", "업비트").strip())
+    # Compile the command regex at startup rather than on the first matching message.
+    _upbit_command_pattern(upbit_command_prefix)
     backup_dir = os.getenv("SPREADSHEET_BACKUP_DIR", "/Users/test/AIassistant/spreadsheet_backups").strip()
     result_spreadsheet_id = os.getenv("RESULT_SPREADSHEET_ID", "").strip()
+    receive_mode = os.getenv("RECEIVE_MODE", "polling").strip().lower()
+    webhook_url = os.getenv("WEBHOOK_URL", "").strip()
+    webhook_path = os.getenv("WEBHOOK_PATH", "").strip() or urlparse(webhook_url).path or "/"
+    webhook_listen_host = os.getenv("WEBHOOK_LISTEN_HOST", "127.0.0.1").strip()
+    webhook_listen_port = int(os.getenv("WEBHOOK_LISTEN_PORT", "8080"))
+    webhook_secret_token = os.getenv("WEBHOOK_SECRET_TOKEN", "").strip()
     spreadsheet_id_map = parse_spreadsheet_id_map(os.getenv("SPREADSHEET_ID_MAP", "").strip())
     spreadsheet_id_map_file = os.getenv("SPREADSHEET_ID_MAP_FILE", "").strip()
     if spreadsheet_id_map_file:
@@ -1163,13 +1650,24 @@ def build_app_config() -> AppConfig:
         upbit_market_sheet_map=upbit_market_sheet_map,
         upbit_base_url=upbit_base_url,
         upbit_orders_path=upbit_orders_path,
+        upbit_max_pages=upbit_max_pages,
         upbit_command_prefix=upbit_command_prefix,
         backup_dir=backup_dir,
         spreadsheet_id_map=spreadsheet_id_map,
         result_spreadsheet_id=result_spreadsheet_id,
+        receive_mode=receive_mode,
+        webhook_url=webhook_url,
+        webhook_path=webhook_path,
+        webhook_listen_host=webhook_listen_host,
+        webhook_listen_port=webhook_listen_port,
+        webhook_secret_token=webhook_secret_token,
     )
 
 
+def queue_reply(ctx: UpdateContext, text: str) -> None:
+    ctx.replies.setdefault(int(ctx.chat_id), []).append(text)
+
+
 def handle_upbit_command_strategy(ctx: UpdateContext) -> bool:
     cmd_parsed = parse_upbit_symbol_command(ctx.text, ctx.cfg.upbit_command_prefix, ctx.cfg.tz_name)
     if cmd_parsed is None:
@@ -1178,26 +1676,18 @@ def handle_upbit_command_strategy(ctx: UpdateContext) -> bool:
     target_symbol, cmd_date, explicit_date = cmd_parsed
     if not ctx.cfg.upbit_enabled:
         if ctx.chat_id is not None:
-            send_telegram_message(
-                ctx.cfg.token,
-                ctx.chat_id,
-                "업비트 기능이 비활성화되어 있습니다. (UPBIT_ENABLED=false)",
-            )
+            queue_reply(ctx, "업비트 기능이 비활성화되어 있습니다. (UPBIT_ENABLED=false)")
         log("upbit_command_ignored_disabled")
         return True
 
     if not ctx.cfg.upbit_access_key or not ctx.cfg.upbit_secret_key:
         if ctx.chat_id is not None:
-            send_telegram_message(ctx.cfg.token, ctx.chat_id, "업비트 API 키가 설정되지 않았습니다.")
+            queue_reply(ctx, "업비트 API 키가 설정되지 않았습니다.")
         log("upbit_command_ignored_missing_keys")
         return True
     if not ctx.cfg.upbit_market_sheet_map:
         if ctx.chat_id is not None:
-            send_telegram_message(
-                ctx.cfg.token,
-                ctx.chat_id,
-                "업비트 마켓 매핑이 비어 있습니다. UPBIT_MARKET_SHEET_MAP을 설정하세요.",
-            )
+            queue_reply(ctx, "업비트 마켓 매핑이 비어 있습니다. UPBIT_MARKET_SHEET_MAP을 설정하세요.")
         log("upbit_command_ignored_missing_market_sheet_map")
         return True
     symbol_market_map = {v.upper(): k.upper() for k, v in ctx.cfg.upbit_market_sheet_map.items()}
@@ -1205,9 +1695,8 @@ def handle_upbit_command_strategy(ctx: UpdateContext) -> bool:
     if not target_market:
         allowed_symbols = sorted(symbol_market_map.keys())
         if ctx.chat_id is not None:
-            send_telegram_message(
-                ctx.cfg.token,
-                ctx.chat_id,
+            queue_reply(
+                ctx,
                 f"지원하지 않는 코인 심볼입니다: {target_symbol}\n지원 심볼: {', '.join(allowed_symbols)}",
             )
         log(f"upbit_command_ignored_unknown_symbol symbol={target_symbol}")
@@ -1225,19 +1714,15 @@ def handle_upbit_command_strategy(ctx: UpdateContext) -> bool:
         upbit_sheet_symbol=target_symbol,
         upbit_base_url=ctx.cfg.upbit_base_url,
         upbit_orders_path=ctx.cfg.upbit_orders_path,
+        upbit_max_pages=ctx.cfg.upbit_max_pages,
         explicit_date=explicit_date,
         spreadsheet_id_map=ctx.cfg.spreadsheet_id_map,
         backup_dir=ctx.cfg.backup_dir,
         backup_cache=ctx.backup_cache,
         backup_context=f"upbit_update_{ctx.update_id}_{cmd_date.isoformat()}",
     )
-    save_state(ctx.cfg.state_file, ctx.state)
     if ctx.chat_id is not None:
-        send_telegram_message(
-            ctx.cfg.token,
-            ctx.chat_id,
-            build_upbit_command_result_text(processed_count, written_count, last_result),
-        )
+        queue_reply(ctx, build_upbit_command_result_text(processed_count, written_count, last_result))
     log(f"upbit_command_done date={cmd_date.isoformat()} processed={processed_count} written={written_count}")
     return True
 
@@ -1261,7 +1746,7 @@ def handle_meritz_message_strategy(ctx: UpdateContext) -> bool:
         backup_context=f"meritz_update_{ctx.update_id}",
     )
     if result and ctx.chat_id is not None:
-        send_telegram_message(ctx.cfg.token, ctx.chat_id, build_reply_text(result))
+        queue_reply(ctx, build_reply_text(result))
     log(f"processed update_id={ctx.update_id} symbol={msg.symbol}")
     return True
 
@@ -1274,11 +1759,7 @@ def handle_sell_complete_strategy(ctx: UpdateContext) -> bool:
     if not ctx.cfg.result_spreadsheet_id:
         log("sell_complete_ignored: RESULT_SPREADSHEET_ID not configured")
         if ctx.chat_id is not None:
-            send_telegram_message(
-                ctx.cfg.token,
-                ctx.chat_id,
-                "결과표 스프레드시트 ID가 설정되지 않았습니다. RESULT_SPREADSHEET_ID를 설정하세요.",
-            )
+            queue_reply(ctx, "결과표 스프레드시트 ID가 설정되지 않았습니다. RESULT_SPREADSHEET_ID를 설정하세요.")
         return True
     try:
         reply = process_sell_complete(
@@ -1294,14 +1775,10 @@ def handle_sell_complete_strategy(ctx: UpdateContext) -> bool:
     except Exception as e:
         log(f"sell_complete_error symbol={symbol}: {e}")
         if ctx.chat_id is not None:
-            send_telegram_message(
-                ctx.cfg.token,
-                ctx.chat_id,
-                f"{symbol} 매도 완료 결과표 기록 실패: {e}",
-            )
+            queue_reply(ctx, f"{symbol} 매도 완료 결과표 기록 실패: {e}")
         return True
     if ctx.chat_id is not None:
-        send_telegram_message(ctx.cfg.token, ctx.chat_id, reply)
+        queue_reply(ctx, reply)
     return True
 
 
@@ -1317,74 +1794,279 @@ def dispatch_update(ctx: UpdateContext, strategies: List[StrategyHandler]) -> bo
     return False
 
 
+def handle_update(
+    upd: Dict,
+    gc: gspread.Client,
+    state: BotState,
+    cfg: AppConfig,
+    strategies: List[StrategyHandler],
+    backup_cache: set,
+    replies: Dict[int, List[str]],
+) -> None:
+    upd_id = upd["update_id"]
+    try:
+        text = get_update_text(upd)
+        if text:
+            log(f"update_processing update_id={upd_id}")
+            chat_id = get_update_chat_id(upd)
+            if chat_id is not None:
+                state.default_chat_id = int(chat_id)
+            ctx = UpdateContext(
+                update_id=upd_id,
+                text=text,
+                chat_id=chat_id,
+                gc=gc,
+                state=state,
+                cfg=cfg,
+                backup_cache=backup_cache,
+                replies=replies,
+            )
+            dispatch_update(ctx, strategies)
+    except Exception as per_update_error:
+        if isinstance(per_update_error, gspread.exceptions.APIError):
+            # Sheet may have been moved/renamed/restructured; re-resolve on the next update.
+            invalidate_sheet_caches()
+        logger.error(
+            "error(update_id=%s): %s: %r",
+            upd_id,
+            per_update_error.__class__.__name__,
+            per_update_error,
+            exc_info=True,
+        )
+
+
+def handle_update_batch(
+    updates: List[Dict],
+    gc: gspread.Client,
+    state: BotState,
+    cfg: AppConfig,
+    strategies: List[StrategyHandler],
+) -> None:
+    # Handle updates in order and persist state once for the whole batch; handlers only mutate `state`.
+    # Dedup by id rather than by a high-water mark: an update arriving after a higher id (or after Telegram
+    # restarts the id sequence) must still be handled.
+    seen_ids = dict.fromkeys(state.recent_update_ids)
+    handled_any = False
+    # Shared by the whole batch: each spreadsheet is exported at most once before the batch writes to it.
+    backup_cache: set = set()
+    replies: Dict[int, List[str]] = {}
+    for upd in updates:
+        upd_id = upd["update_id"]
+        if upd_id in seen_ids:
+            # Already handled (e.g. a webhook redelivery after a slow response).
+            continue
+        handle_update(upd, gc, state, cfg, strategies, backup_cache, replies)
+        seen_ids[upd_id] = None
+        # Last handled id, not the max: polling resumes from here.
+        state.last_update_id = upd_id
+        handled_any = True
+    if handled_any:
+        state.recent_update_ids = list(seen_ids)[-RECENT_UPDATE_IDS_LIMIT:]
+    # Saved even for an all-duplicate batch: a redelivery after a failed save must persist the state
+    # before it is acknowledged. save_state skips the write when nothing changed.
+    save_state(cfg.state_file, state)
+    # After the state save: a failed send must not cause the sheet writes to be replayed.
+    flush_replies(cfg.token, replies)
+
+
+def run_update_worker(
+    deliveries_q: "queue.Queue[WebhookDelivery]",
+    gc: gspread.Client,
+    state: BotState,
+    cfg: AppConfig,
+    strategies: List[StrategyHandler],
+) -> None:
+    # Single consumer, no handler pool: updates are applied strictly in order (polling does the same inline)
+    # because they are not independent. Consecutive fills for one symbol hit the same sheet, and the second
+    # one's date row lookup and LOC평단/LOC고가 choice depend on the first one's write; the R6 average that
+    # drives the full/half-round ratio is a formula over earlier rows; and 매도 완료 appends to the shared
+    # result spreadsheet. A thread pool with only a state lock would race on all three.
+    while True:
+        delivery = deliveries_q.get()
+        try:
+            handle_update_batch(delivery.updates, gc, state, cfg, strategies)
+            delivery.ok = True
+        except Exception:
+            logger.exception("update_batch_error")
+        finally:
+            delivery.done.set()
+
+
+def poll_updates_forever(
+    cfg: AppConfig,
+    gc: gspread.Client,
+    state: BotState,
+    strategies: List[StrategyHandler],
+    offset: int,
+) -> None:
+    # A getUpdates with an offset past a batch tells Telegram to delete it, so the next poll only goes out
+    # after the batch has been handled and saved; a restart mid-batch re-delivers it instead of losing it.
+    # A near-full batch means a backlog: re-poll immediately with timeout=0 until it drains. Idle polls
+    # stretch the long-poll up to TELEGRAM_MAX_POLL_TIMEOUT (never below the configured timeout).
+    poll_timeout = cfg.poll_timeout
+    fail_streak = 0
+    while True:
+        try:
+            updates = fetch_updates(cfg.token, offset, poll_timeout)
+        except Exception as e:
+            # Exponential backoff with jitter during a Telegram outage; reset on the first good poll.
+            fail_streak += 1
+            delay = min(60, max(3, cfg.poll_interval) * 2 ** min(fail_streak - 1, 5)) * random.uniform(0.5, 1.5)
+            log(f"error: {e} retry_in={delay:.1f}s fail_streak={fail_streak}")
+            if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 409:
+                # A webhook is still registered (deleteWebhook failed at startup).
+                try:
+                    delete_telegram_webhook(cfg.token)
+                except Exception as delete_error:
+                    log(f"delete_webhook_error: {delete_error}")
+            time.sleep(delay)
+            continue
+        fail_streak = 0
+        if updates:
+            log(f"updates_received count={len(updates)}")
+            try:
+                handle_update_batch(updates, gc, state, cfg, strategies)
+            except Exception:
+                # Offset not advanced: the batch is fetched again and already-handled ids are skipped.
+                logger.exception("update_batch_error")
+                time.sleep(max(3, cfg.poll_interval))
+                continue
+            # getUpdates returns updates in ascending update_id order.
+            offset = updates[-1]["update_id"] + 1
+        if len(updates) >= TELEGRAM_BURST_BATCH:
+            poll_timeout = 0
+            continue
+        if updates:
+            poll_timeout = cfg.poll_timeout
+        else:
+            poll_timeout = max(cfg.poll_timeout, min(TELEGRAM_MAX_POLL_TIMEOUT, poll_timeout * 2))
+        time.sleep(cfg.poll_interval)
+
+
+def run_polling(
+    cfg: AppConfig,
+    gc: gspread.Client,
+    state: BotState,
+    strategies: List[StrategyHandler],
+    has_state: bool,
+) -> None:
+    try:
+        delete_telegram_webhook(cfg.token)
+    except Exception as e:
+        # Best effort: a transient network error at boot must not stop the bot; if a webhook really is
+        # still registered, the poller gets 409 from getUpdates and deletes it then.
+        log(f"delete_webhook_error: {e}")
+    offset = state.last_update_id + 1
+
+    if (not has_state) and cfg.start_latest_first:
+        warmup = fetch_updates(cfg.token, 0, 0)
+        if warmup:
+            offset = warmup[-1]["update_id"] + 1
+            state.last_update_id = offset - 1
+            save_state(cfg.state_file, state)
+            log(f"warmup_skip_old_updates count={len(warmup)} offset={offset}")
+
+    poll_updates_forever(cfg, gc, state, strategies, offset)
+
+
+def run_webhook(
+    cfg: AppConfig,
+    gc: gspread.Client,
+    state: BotState,
+    strategies: List[StrategyHandler],
+    has_state: bool,
+) -> None:
+    """Receive updates pushed by Telegram; a single worker thread applies them in order."""
+    set_telegram_webhook(
+        cfg.token,
+        cfg.webhook_url,
+        cfg.webhook_secret_token,
+        drop_pending_updates=(not has_state) and cfg.start_latest_first,
+    )
+    log(f"webhook_registered url={cfg.webhook_url}")
+    deliveries_q: "queue.Queue[WebhookDelivery]" = queue.Queue()
+
+    class WebhookRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            if self.path != cfg.webhook_path:
+                self.send_error(404)
+                return
+            if not hmac.compare_digest(
+                self.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), cfg.webhook_secret_token
+            ):
+                self.send_error(403)
+                return
+            length_header = self.headers.get("Content-Length")
+            if length_header is None:
+                self.send_error(411)
+                return
+            try:
+                length = int(length_header)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # rfile.read(-1) would block this thread until the client closes the connection.
+                self.send_error(400)
+                return
+            try:
+                upd = json_loads(self.rfile.read(length))
+            except ValueError:
+                self.send_error(400)
+                return
+            if isinstance(upd, dict) and "update_id" in upd:
+                # Telegram drops an update once it gets 200, so answer only after it is handled and saved;
+                # 500 makes Telegram redeliver (max_connections=1 keeps deliveries serialized meanwhile).
+                delivery = WebhookDelivery(updates=[upd])
+                deliveries_q.put(delivery)
+                delivery.done.wait()
+                if not delivery.ok:
+                    self.send_error(500)
+                    return
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format: str, *args) -> None:
+            # Keep bot.log to the bot's own events.
+            return
+
+    threading.Thread(
+        target=run_update_worker,
+        args=(deliveries_q, gc, state, cfg, strategies),
+        name="telegram-update-worker",
+        daemon=True,
+    ).start()
+    server = ThreadingHTTPServer((cfg.webhook_listen_host, cfg.webhook_listen_port), WebhookRequestHandler)
+    log(f"webhook_listening host={cfg.webhook_listen_host} port={cfg.webhook_listen_port} path={cfg.webhook_path}")
+    server.serve_forever()
+
+
 def main() -> None:
     load_dotenv()
+    setup_logging()
     cfg = build_app_config()
 
     if not cfg.token:
         raise ValueError("TELEGRAM_BOT_TOKEN is required")
     if not cfg.sa_file:
         raise ValueError("GOOGLE_SERVICE_ACCOUNT_FILE is required")
+    if cfg.receive_mode not in {"polling", "webhook"}:
+        raise ValueError(f"RECEIVE_MODE must be polling or webhook: {cfg.receive_mode}")
+    if cfg.receive_mode == "webhook" and not cfg.webhook_url:
+        raise ValueError("WEBHOOK_URL is required when RECEIVE_MODE=webhook")
+    if cfg.receive_mode == "webhook" and not cfg.webhook_secret_token:
+        # Without it anyone reaching the listener could post fake fill messages into the sheets.
+        raise ValueError("WEBHOOK_SECRET_TOKEN is required when RECEIVE_MODE=webhook")
 
     log("bot_start")
     gc = gspread.service_account(filename=cfg.sa_file)
     strategies = build_strategies()
     has_state = cfg.state_file.exists()
     state = load_state(cfg.state_file)
-    offset = int(state.get("last_update_id", 0)) + 1
 
-    if (not has_state) and cfg.start_latest_first:
-        warmup = fetch_updates(cfg.token, 0, 0)
-        if warmup:
-            offset = max(int(x["update_id"]) for x in warmup) + 1
-            state["last_update_id"] = offset - 1
-            save_state(cfg.state_file, state)
-            log(f"warmup_skip_old_updates count={len(warmup)} offset={offset}")
-
-    while True:
-        try:
-            updates = fetch_updates(cfg.token, offset, cfg.poll_timeout)
-            if updates:
-                log(f"updates_received count={len(updates)}")
-            for upd in updates:
-                upd_id = int(upd["update_id"])
-                backup_cache = set()
-                try:
-                    text = get_update_text(upd)
-                    if text:
-                        log(f"update_processing update_id={upd_id}")
-                        chat_id = get_update_chat_id(upd)
-                        if chat_id is not None:
-                            state["default_chat_id"] = int(chat_id)
-                        ctx = UpdateContext(
-                            update_id=upd_id,
-                            text=text,
-                            chat_id=chat_id,
-                            gc=gc,
-                            state=state,
-                            cfg=cfg,
-                            backup_cache=backup_cache,
-                        )
-                        handled = dispatch_update(ctx, strategies)
-                        if handled:
-                            offset = max(offset, upd_id + 1)
-                            continue
-                except Exception as per_update_error:
-                    log(
-                        f"error(update_id={upd_id}): "
-                        f"{per_update_error.__class__.__name__}: {repr(per_update_error)}"
-                    )
-                    log(traceback.format_exc(limit=3).strip())
-                offset = max(offset, upd_id + 1)
-
-            state["last_update_id"] = offset - 1
-            save_state(cfg.state_file, state)
-        except Exception as e:
-            log(f"error: {e}")
-            time.sleep(max(3, cfg.poll_interval))
-            continue
-
-        time.sleep(cfg.poll_interval)
+    if cfg.receive_mode == "webhook":
+        run_webhook(cfg, gc, state, strategies, has_state)
+    else:
+        run_polling(cfg, gc, state, strategies, has_state)
 
 
 if __name__ == "__main__":